@@ -1,32 +1,380 @@
-from flask import Flask, render_template, request
-import subprocess
+from flask import Flask, Response, jsonify, render_template, request
+import json
+import logging
 import os
-import whisper
+import tempfile
+import time
+
+from audio import AudioWorkspace
+from batch import BatchRunner
+from cache import TranscriptCache, cache_key, extract_video_id
+from chunking import ChunkedTranscriber
+from jobs import DONE, FAILED, JobQueue
+from metrics import metrics
+from models import ModelRegistry, UnknownModel
+from sources import CaptionSource, TranscriptPipeline, WhisperSource
+from summarize import OpenAIBackend, StubBackend, Summarizer
 
 app = Flask(__name__)
 
-# Whisperモデルロード（tinyで高速）
-model = whisper.load_model("tiny")
+# 計測ログは1行1JSONで出す
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(message)s")
+
+# Whisperモデルは使うときに読み込む（デフォルトはtinyで高速）
+DEFAULT_MODEL = os.environ.get("WHISPER_MODEL", "tiny")
+ALLOWED_MODELS = os.environ.get("ALLOWED_MODELS", "tiny,base,small").split(",")
+TRANSCRIBE_OPTIONS = {}
+models = ModelRegistry(
+    set(ALLOWED_MODELS) | {DEFAULT_MODEL},
+    max_resident=int(os.environ.get("MAX_RESIDENT_MODELS", 1)),
+)
+
+# gunicorn --preload と組み合わせると、ワーカー間でモデルを共有できる
+PRELOAD_MODELS = [m for m in os.environ.get("PRELOAD_MODELS", "").split(",") if m]
+if PRELOAD_MODELS:
+    models.preload(PRELOAD_MODELS)
+
+# 長い音声はチャンクに分けて複数プロセスで文字起こしする
+transcriber = ChunkedTranscriber(
+    models, TRANSCRIBE_OPTIONS,
+    workers=int(os.environ.get("TRANSCRIBE_WORKERS", 1)),
+    chunk_seconds=float(os.environ.get("CHUNK_SECONDS", 30)),
+    overlap_seconds=float(os.environ.get("CHUNK_OVERLAP", 2)),
+)
+
+# 音声はジョブごとの一時ディレクトリに落とし、使い終わったら消す
+# （AUDIO_DISK_QUOTA_MBは同じAUDIO_WORK_DIRを使う全ワーカーで共有する）
+workspace = AudioWorkspace(
+    os.environ.get("AUDIO_WORK_DIR", os.path.join(tempfile.gettempdir(), "youtube-summarizer")),
+    quota_bytes=int(os.environ.get("AUDIO_DISK_QUOTA_MB", 2048)) * 1024 * 1024,
+    max_download_bytes=int(os.environ.get("AUDIO_MAX_DOWNLOAD_MB", 512)) * 1024 * 1024,
+)
+
+# 字幕があればそれを使い、なければ音声をWhisperで文字起こしする
+CAPTION_LANGUAGES = os.environ.get("CAPTION_LANGUAGES", "ja,en").split(",")
+captions = CaptionSource(CAPTION_LANGUAGES)
+whisper_source = WhisperSource(transcriber, workspace.fetch)
+pipeline = TranscriptPipeline([captions, whisper_source])
+
+# 同じ動画の文字起こし結果を再利用する
+cache = TranscriptCache(
+    os.environ.get("CACHE_DIR", "cache"),
+    max_bytes=int(os.environ.get("CACHE_MAX_MB", 500)) * 1024 * 1024,
+    memory_items=int(os.environ.get("CACHE_MEMORY_ITEMS", 64)),
+)
+
+# 要約のLLM。キーがなければ要約は無効にする（stubはオフラインのテスト・開発用）
+SUMMARY_BACKEND = os.environ.get("SUMMARY_BACKEND", "openai")
+if SUMMARY_BACKEND == "stub":
+    summary_backend = StubBackend()
+elif SUMMARY_BACKEND == "openai":
+    summary_backend = OpenAIBackend(os.environ.get("SUMMARY_MODEL", "gpt-4o-mini")) if os.environ.get("OPENAI_API_KEY") else None
+else:
+    raise ValueError("unknown SUMMARY_BACKEND: %s" % SUMMARY_BACKEND)
+summarizer = None
+if summary_backend is not None:
+    summarizer = Summarizer(
+        summary_backend,
+        cache=TranscriptCache(
+            os.path.join(os.environ.get("CACHE_DIR", "cache"), "summaries"),
+            max_bytes=int(os.environ.get("SUMMARY_CACHE_MAX_MB", 50)) * 1024 * 1024,
+        ),
+        max_chunk_tokens=int(os.environ.get("SUMMARY_CHUNK_TOKENS", 2000)),
+        workers=int(os.environ.get("SUMMARY_WORKERS", 4)),
+    )
+
+
+def transcript_key(url, model_name):
+    video_id = extract_video_id(url)
+    if video_id is None:
+        return None
+    options = dict(TRANSCRIBE_OPTIONS, caption_languages=CAPTION_LANGUAGES)
+    return cache_key(video_id, model_name, options)
+
+
+def store(job, result):
+    key = transcript_key(job.url, job.model)
+    if key is not None:
+        cache.put(key, result)
+    return result
+
+
+def transcribe(job):
+    return store(job, pipeline.run(job.url, extract_video_id(job.url), job))
+
+
+# 文字起こしはワーカーで実行し、リクエストスレッドは待たせない
+queue = JobQueue(transcribe, workers=int(os.environ.get("JOB_WORKERS", 1)))
+
+
+def summarize(job):
+    with metrics.stage("summarize"):
+        summary = summarizer.summarize(job.options["transcript"], job.options["length"], job.options["style"])
+    return dict(summary, source_job=job.options["source_job"])
+
+
+# 長い動画の要約はmap-reduceで時間がかかるので、文字起こしと同じくワーカーで実行する
+summaries = JobQueue(summarize, workers=int(os.environ.get("SUMMARY_JOB_WORKERS", 1)))
+
+# SSEの接続はこの秒数で切り、EventSourceにLast-Event-ID付きで再接続させる
+# （開いたままの結果ページでgunicornのスレッドを使い切らないように）
+SSE_MAX_SECONDS = float(os.environ.get("SSE_MAX_SECONDS", 30))
+
+
+def check_model(model_name):
+    model_name = model_name or DEFAULT_MODEL
+    if model_name not in models.allowed:
+        raise UnknownModel("unknown model: %s" % model_name)
+    return model_name
+
+
+def cached_result(url, model_name):
+    key = transcript_key(url, model_name)
+    if key is None:
+        return None
+    return cache.get(key)
+
+
+def submit(url, model_name=None):
+    model_name = check_model(model_name)
+    # キャッシュにあればyt-dlpもwhisperも通さずに完了させる
+    cached = cached_result(url, model_name)
+    if cached is not None:
+        return queue.add_done(url, cached, cached["segments"], model_name)
+    return queue.submit(url, model_name)
+
+
+def prepare_batch_job(job):
+    # 準備段: キャッシュ → 字幕の順に試す
+    cached = cached_result(job.url, job.model)
+    if cached is not None:
+        job.add_segments(cached["segments"])
+        return cached
+    result = captions.transcribe(job.url, extract_video_id(job.url), job)
+    if result is not None:
+        return store(job, result)
+    return None
+
+
+def acquire_batch_job(job):
+    # ダウンロード段
+    return whisper_source.acquire(job.url, job)
+
+
+def infer_batch_job(job, audio):
+    # 推論段
+    return store(job, whisper_source.transcribe_audio(audio, job))
+
+
+# 再生リストやURLの一覧をまとめて処理する
+batches = BatchRunner(
+    queue, prepare_batch_job, acquire_batch_job, infer_batch_job,
+    download_workers=int(os.environ.get("BATCH_DOWNLOAD_WORKERS", 2)),
+    inference_workers=int(os.environ.get("BATCH_INFERENCE_WORKERS", 1)),
+    prefetch=int(os.environ.get("BATCH_PREFETCH", 2)),
+)
+
 
 @app.route("/", methods=["GET", "POST"])
 def index():
-    transcript = ""
+    job = None
+    error = None
     if request.method == "POST":
         url = request.form.get("url")
         if url:
-            # 音声ダウンロード
-            os.makedirs("output", exist_ok=True)
-            audio_path = "output/audio.mp3"
-            subprocess.run([
-                "yt-dlp", "-x", "--audio-format", "mp3",
-                "-o", audio_path, url
-            ])
-
-            # 文字起こし
-            result = model.transcribe(audio_path)
-            transcript = result["text"]
-
-    return render_template("index.html", transcript=transcript)
+            try:
+                job = submit(url, request.form.get("model"))
+            except UnknownModel as e:
+                error = str(e)
+
+    with metrics.stage("render"):
+        return render_template(
+            "index.html", job=job, error=error,
+            models=ALLOWED_MODELS, default_model=DEFAULT_MODEL,
+            summaries=summarizer is not None,
+        )
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    data = request.get_json(silent=True) or request.form
+    if not hasattr(data, "get"):
+        return jsonify(error="request body must be a JSON object"), 400
+    url = data.get("url")
+    if not url or not isinstance(url, str):
+        return jsonify(error="url is required"), 400
+    try:
+        job = submit(url, data.get("model"))
+    except UnknownModel as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify(error="job not found"), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/transcript")
+def job_transcript(job_id):
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify(error="job not found"), 404
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 409
+    return jsonify(
+        id=job.id,
+        transcript=job.result["text"],
+        segments=job.result["segments"],
+        source=job.result["source"],
+        language=job.result["language"],
+    )
+
+
+@app.route("/jobs/<job_id>/summary", methods=["POST"])
+def job_summary(job_id):
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify(error="job not found"), 404
+    if summarizer is None:
+        return jsonify(error="summaries are not configured (set OPENAI_API_KEY)"), 503
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 409
+    data = request.get_json(silent=True) or request.form
+    if not hasattr(data, "get"):
+        return jsonify(error="request body must be a JSON object"), 400
+    length = data.get("length", "medium")
+    style = data.get("style", "paragraph")
+    try:
+        summarizer.check(length, style)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    summary_job = summaries.submit(job.url, options={
+        "source_job": job.id, "transcript": job.result, "length": length, "style": style,
+    })
+    return jsonify(summary_job.to_dict()), 202
+
+
+@app.route("/summaries/<summary_id>")
+def summary_status(summary_id):
+    summary_job = summaries.get(summary_id)
+    if summary_job is None:
+        return jsonify(error="summary not found"), 404
+    if summary_job.status != DONE:
+        return jsonify(summary_job.to_dict())
+    return jsonify(dict(summary_job.to_dict(), **summary_job.result))
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    # Server-Sent Eventsでセグメントを届いた順に送る
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify(error="job not found"), 404
+
+    def sse(event, data, event_id=None):
+        head = "id: %d\n" % event_id if event_id is not None else ""
+        return head + "event: %s\ndata: %s\n\n" % (event, json.dumps(data, ensure_ascii=False))
+
+    # 再接続時は送信済みのセグメントを飛ばす
+    resume = request.headers.get("Last-Event-ID", "0")
+
+    def stream():
+        sent = int(resume) if resume.isdigit() else 0
+        stage = None
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        yield "retry: 1000\n\n"
+        while True:
+            job.wait(sent, stage, timeout=max(0, min(15, deadline - time.monotonic())))
+            status = job.status  # 完了判定はセグメントを読む前に取る
+            segments = job.segments[sent:]
+            for i, segment in enumerate(segments, sent + 1):
+                yield sse("segment", segment, i)
+            sent += len(segments)
+            if segments or job.stage != stage:
+                stage = job.stage
+                yield sse("status", job.to_dict())
+            else:
+                yield ": keep-alive\n\n"
+            if status == DONE:
+                yield sse("done", {"transcript": job.result["text"], "source": job.result["source"]})
+                return
+            if status == FAILED:
+                yield sse("failed", {"error": job.error})
+                return
+            if time.monotonic() >= deadline:
+                return
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/batches", methods=["POST"])
+def create_batch():
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {"urls": request.form.get("urls", "").split(), "model": request.form.get("model")}
+    if not isinstance(data, dict):
+        return jsonify(error="request body must be a JSON object"), 400
+    urls = data.get("urls") or []
+    if isinstance(urls, str):
+        urls = urls.split()
+    if not urls or not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        return jsonify(error="urls must be a list of URLs"), 400
+    try:
+        model_name = check_model(data.get("model"))
+    except UnknownModel as e:
+        return jsonify(error=str(e)), 400
+    batch = batches.submit(urls, model_name)
+    return jsonify(batch.to_dict()), 202
+
+
+@app.route("/batches/<batch_id>")
+def batch_status(batch_id):
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify(error="batch not found"), 404
+    return jsonify(batch.to_dict())
+
+
+@app.route("/batches/<batch_id>/export")
+def batch_export(batch_id):
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify(error="batch not found"), 404
+    try:
+        with metrics.stage("render"):
+            body, mimetype, ext = batch.export(request.args.get("format", "json"))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return Response(body, mimetype=mimetype, headers={
+        "Content-Disposition": "attachment; filename=batch-%s.%s" % (batch.id, ext),
+    })
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    for name, value in cache.stats().items():
+        if name in ("hits", "misses", "evictions"):
+            metrics.set_counter("transcriber_cache_%s_total" % name, value, "Transcript cache %s." % name)
+        else:
+            metrics.set_gauge("transcriber_cache_%s" % name, value, "Transcript cache %s." % name.replace("_", " "))
+    metrics.set_gauge("transcriber_resident_models", len(models.resident()), "Whisper models currently loaded.")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/healthz")
+def healthz():
+    # モデルを読み込まずに返す
+    return jsonify(status="ok", resident_models=models.resident())
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify(cache.stats())
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True)
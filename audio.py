@@ -0,0 +1,111 @@
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windowsではgunicornを使わないので1プロセス内の排他だけでよい
+    fcntl = None
+
+from metrics import metrics
+
+
+class AudioUnavailable(Exception):
+    pass
+
+
+def download_audio(url, directory, max_bytes):
+    # mp3への再エンコードはせず、元の音声ストリームをそのまま取る
+    subprocess.run([
+        "yt-dlp", "-f", "bestaudio/best", "--no-playlist",
+        "--max-filesize", str(max_bytes),
+        "-o", os.path.join(directory, "audio.%(ext)s"), url
+    ], check=True)
+    files = [f for f in glob.glob(os.path.join(directory, "audio.*")) if not f.endswith(".part")]
+    if not files:
+        raise AudioUnavailable("no audio downloaded for %s (larger than %d bytes?)" % (url, max_bytes))
+    return files[0]
+
+
+def decode_audio(path):
+    # ffmpegで16kHzモノラルのfloat32配列にする
+    import whisper
+    return whisper.load_audio(path)
+
+
+class AudioWorkspace:
+    # ジョブごとの一時ディレクトリに落とし、16kHzモノラルに直したら消す。
+    # ディスク枠はrootにある作業ディレクトリの数で数えるので、
+    # 同じrootを使うプロセス（gunicornのワーカー）全体で上限を守れる
+    def __init__(self, root, quota_bytes, max_download_bytes, download=download_audio,
+                 decode=decode_audio, wait_timeout=300, poll_interval=1.0):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_download_bytes = min(max_download_bytes, quota_bytes)
+        self.download = download
+        self.decode = decode
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.space = threading.Condition()
+        # ロックファイルはrootの外に置き、作業ディレクトリの数え上げや掃除に混ぜない
+        self.lock_path = os.path.normpath(root) + ".lock"
+        os.makedirs(root, exist_ok=True)
+        self.sweep()
+
+    def sweep(self, older_than=3600):
+        # 異常終了などで残った古い作業ディレクトリを片付ける
+        now = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) > older_than:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    @contextmanager
+    def _locked(self):
+        with self.space:
+            with open(self.lock_path, "a") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+
+    def _reserve(self):
+        with self._locked():
+            in_use = sum(1 for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+            if (in_use + 1) * self.max_download_bytes > self.quota_bytes:
+                return None
+            return tempfile.mkdtemp(dir=self.root)
+
+    @contextmanager
+    def job_dir(self):
+        # ディスク枠を予約してから作業ディレクトリを作る。
+        # 他のプロセスが枠を空けても通知は来ないので、poll_intervalごとに見直す
+        deadline = time.monotonic() + self.wait_timeout
+        directory = self._reserve()
+        while directory is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AudioUnavailable("audio disk quota exceeded")
+            with self.space:
+                self.space.wait(min(remaining, self.poll_interval))
+            directory = self._reserve()
+        try:
+            yield directory
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            with self.space:
+                self.space.notify_all()
+
+    def fetch(self, url):
+        with self.job_dir() as directory:
+            with metrics.stage("download"):
+                path = self.download(url, directory, self.max_download_bytes)
+            with metrics.stage("decode", bytes=os.path.getsize(path)):
+                return self.decode(path)
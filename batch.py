@@ -0,0 +1,240 @@
+import io
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from cache import extract_video_id
+from jobs import DONE, FAILED, QUEUED, RUNNING, Job
+from metrics import current_job
+
+
+def is_playlist(url):
+    parsed = urlparse(url if "//" in url else "//" + url)
+    path = parsed.path.rstrip("/")
+    return (
+        "list" in parse_qs(parsed.query)
+        or path.startswith(("/@", "/channel/", "/c/", "/user/"))
+        or path == "/playlist"
+    )
+
+
+def expand_url(url, depth=1):
+    # 再生リスト/チャンネルはダウンロードせずにメタデータだけ取って動画に展開する
+    video_id = extract_video_id(url)
+    if video_id is not None and not is_playlist(url):
+        return [(video_id, url)]
+    proc = subprocess.run(
+        ["yt-dlp", "--flat-playlist", "-J", url],
+        capture_output=True, text=True, check=True,
+    )
+    info = json.loads(proc.stdout)
+    if "entries" not in info:
+        return [(info.get("id") or url, info.get("webpage_url") or url)]
+    videos = []
+    for entry in info["entries"] or []:
+        if not entry:
+            continue
+        entry_url = entry.get("url") or entry.get("webpage_url") or entry.get("id")
+        if entry.get("_type") == "playlist" or entry.get("ie_key") == "YoutubeTab":
+            if depth <= 0:
+                continue
+            # チャンネルの「動画」タブなどを1段だけ展開する
+            videos.extend(expand_url(entry_url, depth - 1))
+        elif entry_url:
+            videos.append((entry.get("id") or extract_video_id(entry_url) or entry_url, entry_url))
+    return videos
+
+
+def dedupe_videos(videos):
+    seen = set()
+    unique = []
+    for video_id, url in videos:
+        if video_id not in seen:
+            seen.add(video_id)
+            unique.append((video_id, url))
+    return unique
+
+
+def srt_time(seconds):
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return "%02d:%02d:%02d,%03d" % (h, m, s, ms)
+
+
+def to_srt(segments):
+    lines = []
+    for i, s in enumerate(segments, 1):
+        lines.append("%d\n%s --> %s\n%s\n" % (i, srt_time(s["start"]), srt_time(s["end"]), s["text"]))
+    return "\n".join(lines)
+
+
+class Batch:
+    def __init__(self, urls, model):
+        self.id = uuid.uuid4().hex
+        self.urls = urls
+        self.model = model
+        self.status = "expanding"
+        self.error = None
+        self.errors = []  # 展開できなかったURL
+        self.items = []  # (video_id, Job)
+        self.created_at = time.time()
+
+    def to_dict(self):
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for _, job in self.items:
+            counts[job.status] += 1
+        total = len(self.items)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "errors": self.errors,
+            "model": self.model,
+            "total": total,
+            "counts": counts,
+            "progress": round(sum(job.progress for _, job in self.items) / total, 3) if total else 0.0,
+            "items": [{"video_id": video_id, "job": job.id, "url": job.url, "status": job.status}
+                      for video_id, job in self.items],
+            "created_at": self.created_at,
+        }
+
+    def refresh(self):
+        if self.status == "running" and all(job.status in (DONE, FAILED) for _, job in self.items):
+            self.status = "done"
+
+    def export(self, fmt):
+        # 結果をまとめて書き出す（json / srt(zip) / txt）
+        finished = [(video_id, job) for video_id, job in self.items if job.status == DONE]
+        if fmt == "json":
+            data = [dict(video_id=video_id, url=job.url, **job.result) for video_id, job in finished]
+            return json.dumps(data, ensure_ascii=False, indent=2), "application/json", "json"
+        if fmt == "srt":
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+                for video_id, job in finished:
+                    zf.writestr("%s.srt" % video_id, to_srt(job.result["segments"]))
+            return buf.getvalue(), "application/zip", "zip"
+        if fmt == "txt":
+            text = "\n\n".join("# %s\n\n%s" % (job.url, job.result["text"]) for _, job in finished)
+            return text, "text/plain; charset=utf-8", "txt"
+        raise ValueError("unknown export format: %s" % fmt)
+
+
+class BatchRunner:
+    # ダウンロードと文字起こしを別スレッドに分け、前の動画の推論中に次の動画を取りに行く
+    def __init__(self, jobs, prepare, acquire, infer, download_workers=2, inference_workers=1, prefetch=2,
+                 expand=expand_url, max_batches=50):
+        self.jobs = jobs
+        self.prepare = prepare
+        self.acquire = acquire
+        self.infer = infer
+        self.expand = expand
+        self.download_workers = download_workers
+        self.inference_workers = inference_workers
+        self.prefetch = prefetch
+        self.max_batches = max_batches
+        self.batches = OrderedDict()
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def _start(self):
+        # gunicorn --preloadではマスターでimportされるので、スレッドはfork後の最初の投入時に作る
+        if self.pid == os.getpid():
+            return
+        # 展開と、キャッシュ・字幕の確認は音声の先読み待ちで詰まらないよう別のスレッドで行う
+        self.expansions = ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="batch-expand")
+        self.preparations = ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="batch-prepare")
+        self.pending = queue.Queue()
+        # デコード済み音声はメモリを食うので先読みは少数に抑える
+        self.ready = queue.Queue(maxsize=self.prefetch)
+        for i in range(self.download_workers):
+            threading.Thread(target=self._download_loop, args=(self.pending, self.ready),
+                             name="batch-download-%d" % i, daemon=True).start()
+        for i in range(self.inference_workers):
+            threading.Thread(target=self._inference_loop, args=(self.ready,),
+                             name="batch-inference-%d" % i, daemon=True).start()
+        self.pid = os.getpid()
+
+    def submit(self, urls, model):
+        batch = Batch(urls, model)
+        with self.lock:
+            self._start()
+            self.batches[batch.id] = batch
+            while len(self.batches) > self.max_batches:
+                self.batches.popitem(last=False)
+        self.expansions.submit(self._expand, batch)
+        return batch
+
+    def get(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+        if batch is not None:
+            batch.refresh()
+        return batch
+
+    def _expand(self, batch):
+        # 展開に失敗したURLは記録して、残りのURLは続けて処理する
+        videos = []
+        for url in batch.urls:
+            try:
+                videos.extend(self.expand(url))
+            except Exception as e:
+                batch.errors.append({"url": url, "error": str(e)})
+        if not videos and batch.errors:
+            batch.status = "failed"
+            batch.error = "no videos could be expanded"
+            return
+        for video_id, url in dedupe_videos(videos):
+            batch.items.append((video_id, self.jobs.register(Job(url, batch.model))))
+        batch.status = "running"
+        for _, job in batch.items:
+            self.preparations.submit(self._prepare, job)
+
+    def _prepare(self, job):
+        # キャッシュか字幕で済めばここで完了し、音声が要るものだけダウンロード待ちに回す
+        current_job.set(job.id)
+        job.start()
+        try:
+            result = self.prepare(job)
+        except Exception as e:
+            job.finish(FAILED, error=str(e))
+            return
+        if result is not None:
+            job.finish(DONE, result)
+        else:
+            job.update("waiting for download")
+            self.pending.put(job)
+
+    def _download_loop(self, pending, ready):
+        # 推論が追いつくまでready.putで待つのはこの専用スレッドだけ
+        while True:
+            job = pending.get()
+            current_job.set(job.id)
+            try:
+                audio = self.acquire(job)
+            except Exception as e:
+                job.finish(FAILED, error=str(e))
+                continue
+            job.update("waiting for inference")
+            ready.put((job, audio))
+
+    def _inference_loop(self, ready):
+        while True:
+            job, audio = ready.get()
+            current_job.set(job.id)
+            try:
+                result = self.infer(job, audio)
+            except Exception as e:
+                job.finish(FAILED, error=str(e))
+            else:
+                job.finish(DONE, result)
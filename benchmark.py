@@ -0,0 +1,175 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import shutil
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio import AudioWorkspace
+from chunking import ChunkedTranscriber, normalize, word_error_rate
+from jobs import Job
+from models import ModelRegistry
+from sources import SAMPLE_RATE, WhisperSource
+
+# yt-dlpは使わず、手元の音声ファイルでパイプライン全体の速さを測る
+# 例: python benchmark.py --fixtures bench/fixtures --models tiny,base --concurrency 1,2,4
+# bench/fixturesにはLibriVox（パブリックドメイン）の朗読を同梱している。
+# 同じ名前の.txtがあれば正解文として単語誤り率も出す
+
+
+def copy_fixture(url, directory, max_bytes):
+    # yt-dlpの代わり。URLとしてローカルのファイルパスを受け取る
+    path = os.path.join(directory, "audio" + os.path.splitext(url)[1])
+    shutil.copyfile(url, path)
+    return path
+
+
+def synthesize_fixtures(directory, count=3, seconds=60):
+    # --synthetic指定時の合成音声（無音を挟んだトーン。精度ではなく速度の計測用）
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        tone = 0.3 * np.sin(2 * np.pi * (200 + 50 * i) * t) * (np.sin(2 * np.pi * 0.2 * t) > 0)
+        audio = tone + 0.01 * rng.standard_normal(len(t))
+        path = os.path.join(directory, "synthetic-%d.wav" % i)
+        with wave.open(path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+        paths.append(path)
+    return paths
+
+
+def percentile(values, p):
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+def score(reference, text):
+    # 大文字小文字と句読点の違いは誤りに数えない
+    def words(t):
+        return " ".join(w for w in (normalize(w) for w in t.split()) if w)
+    return word_error_rate(words(reference), words(text))
+
+
+def run_one(source, path, model):
+    job = Job(path, model)
+    start = time.perf_counter()
+    audio = source.acquire(path, job)
+    acquired = time.perf_counter()
+    result = source.transcribe_audio(audio, job)
+    done = time.perf_counter()
+    audio_seconds = len(audio) / SAMPLE_RATE
+    reference = os.path.splitext(path)[0] + ".txt"
+    wer = None
+    if os.path.exists(reference):
+        with open(reference) as f:
+            wer = score(f.read(), result["text"])
+    return {
+        "wer": wer,
+        "latency": done - start,
+        "acquire": acquired - start,
+        "inference": done - acquired,
+        "audio_seconds": audio_seconds,
+        "rtf": (done - acquired) / audio_seconds if audio_seconds else 0.0,
+    }
+
+
+def run_case(fixtures, model, concurrency, repeat, chunk_workers, workdir):
+    # whisperのモデルはスレッド間で共有できないので、並列数と同じだけモデルを持たせる
+    workspace = AudioWorkspace(workdir, quota_bytes=10 * 1024 ** 3, max_download_bytes=1024 ** 3,
+                               download=copy_fixture)
+    sources = []
+    for _ in range(concurrency):
+        models = ModelRegistry([model], max_resident=1)
+        models.get(model)  # 読み込み時間は計測に含めない
+        sources.append(WhisperSource(ChunkedTranscriber(models, workers=chunk_workers), workspace.fetch))
+
+    paths = queue.Queue()
+    for path in fixtures * repeat:
+        paths.put(path)
+
+    def worker(source):
+        results = []
+        while True:
+            try:
+                path = paths.get_nowait()
+            except queue.Empty:
+                return results
+            results.append(run_one(source, path, model))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = [r for rs in executor.map(worker, sources) for r in rs]
+    wall = time.perf_counter() - start
+    for source in sources:
+        source.transcriber.close()
+    latencies = [r["latency"] for r in results]
+    wers = [r["wer"] for r in results if r["wer"] is not None]
+    return {
+        "model": model,
+        "concurrency": concurrency,
+        "chunk_workers": chunk_workers,
+        "jobs": len(results),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_second": round(len(results) / wall, 4),
+        "audio_seconds_per_second": round(sum(r["audio_seconds"] for r in results) / wall, 3),
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p90": round(percentile(latencies, 90), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        "acquire_p50": round(percentile([r["acquire"] for r in results], 50), 3),
+        "inference_p50": round(percentile([r["inference"] for r in results], 50), 3),
+        "rtf_mean": round(float(np.mean([r["rtf"] for r in results])), 4),
+        "wer_mean": round(float(np.mean(wers)), 4) if wers else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark")
+    parser.add_argument("--fixtures", default="bench/fixtures", help="directory of local audio files")
+    parser.add_argument("--models", default="tiny")
+    parser.add_argument("--concurrency", default="1,2")
+    parser.add_argument("--chunk-workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="time synthetic tones instead of the fixtures (throughput only, no WER)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="youtube-summarizer-bench-")
+    try:
+        if args.synthetic:
+            os.makedirs(os.path.join(workdir, "fixtures"))
+            fixtures = synthesize_fixtures(os.path.join(workdir, "fixtures"))
+        else:
+            fixtures = sorted(
+                path for path in glob.glob(os.path.join(args.fixtures, "*"))
+                if os.path.splitext(path)[1].lower() in (".wav", ".mp3", ".m4a", ".webm", ".opus", ".ogg", ".flac")
+            )
+            if not fixtures:
+                parser.error("no audio fixtures in %s (use --synthetic to time generated tones)" % args.fixtures)
+
+        rows = []
+        for model in args.models.split(","):
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                row = run_case(fixtures, model, concurrency, args.repeat, args.chunk_workers,
+                               os.path.join(workdir, "audio"))
+                rows.append(row)
+                print(json.dumps(row))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+
+VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+YOUTUBE_HOSTS = ("youtube.com", "youtube-nocookie.com")
+
+
+def extract_video_id(url):
+    # youtu.be/X, watch?v=X&t=30, shorts/X などを同じIDにそろえる
+    url = (url or "").strip()
+    if VIDEO_ID_RE.match(url):
+        return url
+    parsed = urlparse(url if "//" in url else "//" + url)
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    parts = [p for p in parsed.path.split("/") if p]
+    candidate = None
+    if host == "youtu.be" and parts:
+        candidate = parts[0]
+    elif host in YOUTUBE_HOSTS or host.endswith(tuple("." + h for h in YOUTUBE_HOSTS)):
+        # evilyoutube.com のような似た名前のホストは受け付けない
+        if parts and parts[0] == "watch":
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        elif len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v", "e"):
+            candidate = parts[1]
+    if candidate and VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def cache_key(video_id, model_name, options=None):
+    raw = json.dumps({"video_id": video_id, "model": model_name, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    # メモリ上のホット層 + ディスク上のLRU（合計サイズで上限）
+    def __init__(self, directory, max_bytes, memory_items=64):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+        self.index = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _load_index(self):
+        # 起動時に既存ファイルを最終アクセス順に並べる
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            st = os.stat(os.path.join(self.directory, name))
+            entries.append((st.st_mtime, name[:-5], st.st_size))
+        for _, key, size in sorted(entries):
+            self.index[key] = size
+            self.bytes += size
+        self._evict()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self._touch(key)
+                self.hits += 1
+                return self.memory[key]
+            if key not in self.index:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._touch(key)
+            self._remember(key, value)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        with self.lock:
+            if key in self.index:
+                self._drop(key)
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+            self.index[key] = len(data)
+            self.bytes += len(data)
+            self._remember(key, value)
+            self._evict()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.index),
+                "memory_entries": len(self.memory),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+    def _touch(self, key):
+        if key in self.index:
+            self.index.move_to_end(key)
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _drop(self, key):
+        self.bytes -= self.index.pop(key, 0)
+        self.memory.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self.index:
+            key = next(iter(self.index))
+            self._drop(key)
+            self.evictions += 1
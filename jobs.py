@@ -0,0 +1,142 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import current_job, log_event, metrics
+
+
+# ジョブの状態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, url, model=None, options=None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.model = model
+        self.options = options or {}
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.segments = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.changed = threading.Condition()
+
+    def update(self, stage, progress=None):
+        with self.changed:
+            self.stage = stage
+            if progress is not None:
+                self.progress = progress
+            self.changed.notify_all()
+
+    def add_segments(self, segments):
+        # 文字起こし途中のセグメントを順次公開する
+        with self.changed:
+            self.segments.extend(segments)
+            self.changed.notify_all()
+
+    def finish(self, status, result=None, error=None):
+        with self.changed:
+            self.status = status
+            self.stage = status
+            self.result = result
+            self.error = error
+            if status == DONE:
+                self.progress = 1.0
+            self.finished_at = time.time()
+            self.changed.notify_all()
+        metrics.job_finished(status)
+        log_event("job_finished", status=status, seconds=round(self.finished_at - self.created_at, 4), error=error)
+
+    def start(self):
+        # ワーカーが拾った時点で待ち時間を記録する
+        current_job.set(self.id)
+        self.status = RUNNING
+        self.started_at = time.time()
+        metrics.observe_queue_wait(self.started_at - self.created_at)
+
+    def wait(self, seen_segments, seen_stage, timeout):
+        # 新しいセグメントか状態の変化があるまで待つ
+        with self.changed:
+            self.changed.wait_for(
+                lambda: len(self.segments) > seen_segments
+                or self.stage != seen_stage
+                or self.finished_at is not None,
+                timeout,
+            )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "model": self.model,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    # プロセス内のキュー。ワーカー数で同時実行数を制限する
+    def __init__(self, handler, workers=1, max_jobs=200):
+        self.handler = handler
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def submit(self, url, model=None, options=None):
+        job = self.register(Job(url, model, options))
+        self.executor.submit(self._run, job)
+        return job
+
+    def add_done(self, url, result, segments=(), model=None):
+        # キャッシュ済みなどで即座に結果が出るジョブはキューを通さない
+        job = Job(url, model)
+        job.segments = list(segments)
+        job.started_at = job.created_at
+        job.finish(DONE, result)
+        return self.register(job)
+
+    def register(self, job):
+        # 別のスケジューラで動かすジョブも/jobsから見えるようにする
+        with self.lock:
+            self.jobs[job.id] = job
+            self._trim()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job):
+        job.start()
+        try:
+            result = self.handler(job)
+        except Exception as e:
+            job.finish(FAILED, error=str(e))
+        else:
+            job.finish(DONE, result)
+
+    def _trim(self):
+        # 完了済みの古いジョブから捨てる
+        while len(self.jobs) > self.max_jobs:
+            for job_id, job in self.jobs.items():
+                if job.status in (DONE, FAILED):
+                    del self.jobs[job_id]
+                    break
+            else:
+                break
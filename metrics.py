@@ -0,0 +1,134 @@
+import contextvars
+import json
+import logging
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger("youtube_summarizer")
+
+# ログに載せるジョブID（ワーカースレッドごとに設定する）
+current_job = contextvars.ContextVar("current_job", default=None)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+
+def log_event(event, **fields):
+    # 1行1JSONの構造化ログ
+    fields = dict(event=event, job=current_job.get(), **fields)
+    log.info(json.dumps(fields, ensure_ascii=False))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, escape_label(v)) for k, v in labels)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, labels=()):
+        series = self.series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            for bound, n in zip(self.buckets, counts):
+                lines.append("%s_bucket%s %d" % (self.name, format_labels(labels + (("le", bound),)), n))
+            lines.append("%s_bucket%s %d" % (self.name, format_labels(labels + (("le", "+Inf"),)), count))
+            lines.append("%s_sum%s %f" % (self.name, format_labels(labels), total))
+            lines.append("%s_count%s %d" % (self.name, format_labels(labels), count))
+        return lines
+
+
+class Metrics:
+    # Prometheusのテキスト形式で書き出す、プロセス内の計測値
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = Histogram("transcriber_stage_seconds", "Time spent in each pipeline stage.", LATENCY_BUCKETS)
+        self.queue_wait = Histogram("transcriber_queue_wait_seconds", "Time jobs waited before a worker picked them up.", LATENCY_BUCKETS)
+        self.rtf = Histogram("transcriber_real_time_factor", "Inference time divided by audio duration.", RTF_BUCKETS)
+        self.jobs = {}
+        self.counters = {}
+        self.gauges = {}
+
+    @contextmanager
+    def stage(self, name, **fields):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stages.observe(elapsed, (("stage", name), ("status", status)))
+            log_event("stage", stage=name, status=status, seconds=round(elapsed, 4), **fields)
+
+    def observe_queue_wait(self, seconds):
+        with self.lock:
+            self.queue_wait.observe(seconds)
+        log_event("queue_wait", seconds=round(seconds, 4))
+
+    def observe_rtf(self, inference_seconds, audio_seconds, model):
+        if audio_seconds <= 0:
+            return
+        rtf = inference_seconds / audio_seconds
+        with self.lock:
+            self.rtf.observe(rtf, (("model", model),))
+        log_event("rtf", model=model, rtf=round(rtf, 4), audio_seconds=round(audio_seconds, 2))
+
+    def job_finished(self, status):
+        with self.lock:
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+
+    def set_counter(self, name, value, help=""):
+        # 他のオブジェクトが数えている累積値をそのまま書き出す（名前は_totalで終える）
+        with self.lock:
+            self.counters[name] = (value, help)
+
+    def set_gauge(self, name, value, help=""):
+        with self.lock:
+            self.gauges[name] = (value, help)
+
+    def render(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        # ru_maxrssはLinuxではKB単位
+        self.set_gauge("transcriber_memory_max_rss_bytes", usage.ru_maxrss * 1024, "Peak resident memory of this process.")
+        self.set_gauge("transcriber_children_memory_max_rss_bytes", children.ru_maxrss * 1024,
+                       "Peak resident memory of the largest finished child process (yt-dlp, ffmpeg).")
+        with self.lock:
+            lines = []
+            lines += self.stages.render()
+            lines += self.queue_wait.render()
+            lines += self.rtf.render()
+            lines += ["# HELP transcriber_jobs_total Finished jobs by status.", "# TYPE transcriber_jobs_total counter"]
+            for status, n in sorted(self.jobs.items()):
+                lines.append("transcriber_jobs_total%s %d" % (format_labels((("status", status),)), n))
+            for name, (value, help) in sorted(self.counters.items()):
+                lines += ["# HELP %s %s" % (name, help), "# TYPE %s counter" % name, "%s %s" % (name, value)]
+            for name, (value, help) in sorted(self.gauges.items()):
+                lines += ["# HELP %s %s" % (name, help), "# TYPE %s gauge" % name, "%s %s" % (name, value)]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
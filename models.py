@@ -0,0 +1,117 @@
+import gc
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def load_whisper_model(name):
+    # whisper(torch)の読み込みは実際に使うときまで遅らせる
+    import whisper
+    return whisper.load_model(name)
+
+
+class UnknownModel(ValueError):
+    pass
+
+
+class ModelRegistry:
+    # 初めて使うときに読み込み、常駐はmax_resident個までにする（LRU）。
+    # 使用中（pin中）のモデルは外さず、枠が空くまで新しいモデルの読み込みを待たせる
+    def __init__(self, allowed, max_resident=1, load=load_whisper_model):
+        self.allowed = list(allowed)
+        self.max_resident = max(1, max_resident)
+        self.load = load
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.loading = set()
+        self.pins = {}
+        self.inference_locks = {}
+
+    def get(self, name, pin=False):
+        if name not in self.allowed:
+            raise UnknownModel("unknown model: %s" % name)
+        with self.changed:
+            while True:
+                if name in self.models:
+                    return self._take(name, pin)
+                # 同じモデルを同時に二重で読み込まない
+                if name not in self.loading and self._has_room():
+                    break
+                self.changed.wait()
+            self.loading.add(name)
+            # 読み込む前に外しておき、新旧のモデルが同時にメモリに載らないようにする
+            self._unload_old()
+        try:
+            model = self.load(name)
+        except BaseException:
+            with self.changed:
+                self.loading.discard(name)
+                self.changed.notify_all()
+            raise
+        with self.changed:
+            self.loading.discard(name)
+            self.models[name] = model
+            self.changed.notify_all()
+            return self._take(name, pin)
+
+    def release(self, name):
+        with self.changed:
+            self.pins[name] -= 1
+            if not self.pins[name]:
+                del self.pins[name]
+            self.changed.notify_all()
+
+    @contextmanager
+    def pinned(self, name):
+        # ジョブの間ずっとモデルを外させない
+        model = self.get(name, pin=True)
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    @contextmanager
+    def locked(self, name):
+        # whisperはデコードのたびに共有モジュールへフックを付けるので、
+        # 同じモデルでの推論は同時に1つまでにする
+        with self.lock:
+            inference_lock = self.inference_locks.setdefault(name, threading.Lock())
+        with inference_lock:
+            yield
+
+    @contextmanager
+    def using(self, name):
+        with self.pinned(name) as model, self.locked(name):
+            yield model
+
+    def preload(self, names):
+        # gunicornの--preloadでマスターが読み込めば、ワーカーはfork後もコピーオンライトで共有できる
+        for name in names:
+            self.get(name)
+        gc.freeze()
+
+    def resident(self):
+        with self.lock:
+            return list(self.models)
+
+    def _take(self, name, pin):
+        self.models.move_to_end(name)
+        if pin:
+            self.pins[name] = self.pins.get(name, 0) + 1
+        return self.models[name]
+
+    def _has_room(self):
+        busy = sum(1 for name in self.models if name in self.pins)
+        return busy + len(self.loading) < self.max_resident
+
+    def _unload_old(self):
+        unloaded = False
+        for name in list(self.models):
+            if len(self.models) + len(self.loading) <= self.max_resident:
+                break
+            if name not in self.pins:
+                del self.models[name]
+                unloaded = True
+        if unloaded:
+            gc.collect()
@@ -0,0 +1,122 @@
+import time
+
+try:
+    from youtube_transcript_api import CouldNotRetrieveTranscript, YouTubeTranscriptApi
+except ImportError:  # 字幕取得を使わない環境でも動くようにする
+    YouTubeTranscriptApi = None
+    CouldNotRetrieveTranscript = Exception
+
+from metrics import log_event, metrics
+
+SAMPLE_RATE = 16000
+
+
+class NoTranscript(Exception):
+    pass
+
+
+def clean_segments(segments, offset=0.0):
+    return [
+        {"start": offset + float(s["start"]), "end": offset + float(s["end"]), "text": s["text"].strip()}
+        for s in segments
+        if s["text"].strip()
+    ]
+
+
+def make_result(segments, source, language=None):
+    segments = clean_segments(segments)
+    return {
+        "text": " ".join(s["text"] for s in segments),
+        "segments": segments,
+        "source": source,
+        "language": language,
+    }
+
+
+def fetch_youtube_captions(video_id, languages):
+    # 公式字幕 → 自動生成字幕の順で優先言語から探す
+    if YouTubeTranscriptApi is None:
+        return None, None
+    try:
+        if hasattr(YouTubeTranscriptApi, "list"):
+            transcripts = YouTubeTranscriptApi().list(video_id)
+        else:  # 1.0より前のAPI
+            transcripts = YouTubeTranscriptApi.list_transcripts(video_id)
+        transcript = transcripts.find_transcript(languages)
+        captions = transcript.fetch()
+    except CouldNotRetrieveTranscript:
+        return None, None
+    except Exception as e:
+        # 通信エラーなどでも音声からの文字起こしに切り替える
+        log_event("captions_error", video_id=video_id, error="%s: %s" % (type(e).__name__, e))
+        return None, None
+    if hasattr(captions, "to_raw_data"):
+        captions = captions.to_raw_data()
+    return captions, transcript.language_code
+
+
+class CaptionSource:
+    name = "captions"
+
+    def __init__(self, languages, fetch=fetch_youtube_captions):
+        self.languages = languages
+        self.fetch = fetch
+
+    def transcribe(self, url, video_id, job):
+        if video_id is None:
+            return None
+        job.update("fetching captions", 0.1)
+        with metrics.stage("captions"):
+            captions, language = self.fetch(video_id, self.languages)
+        if not captions:
+            return None
+        segments = [
+            {"start": c["start"], "end": c["start"] + c.get("duration", 0.0), "text": c["text"]}
+            for c in captions
+        ]
+        result = make_result(segments, self.name, language)
+        job.add_segments(result["segments"])
+        return result
+
+
+class WhisperSource:
+    name = "whisper"
+
+    def __init__(self, transcriber, fetch_audio):
+        self.transcriber = transcriber
+        self.fetch_audio = fetch_audio
+
+    def acquire(self, url, job):
+        # 音声ダウンロード（16kHzモノラルの配列で受け取る）
+        job.update("downloading", 0.2)
+        return self.fetch_audio(url)
+
+    def transcribe_audio(self, audio, job):
+        # 文字起こし（チャンクごとに結果を流す）
+        job.update("transcribing", 0.3)
+
+        def publish(segments, done):
+            job.add_segments(segments)
+            job.update("transcribing", 0.3 + 0.7 * done)
+
+        start = time.perf_counter()
+        with metrics.stage("inference", model=job.model):
+            segments, language = self.transcriber.transcribe(audio, job.model, publish)
+        metrics.observe_rtf(time.perf_counter() - start, len(audio) / SAMPLE_RATE, job.model)
+        return make_result(segments, self.name, language)
+
+    def transcribe(self, url, video_id, job):
+        return self.transcribe_audio(self.acquire(url, job), job)
+
+
+class TranscriptPipeline:
+    # 安いソースから順に試し、最初に取れた結果を使う
+    def __init__(self, sources):
+        self.sources = sources
+
+    def run(self, url, video_id, job):
+        for source in self.sources:
+            result = source.transcribe(url, video_id, job)
+            if result is not None:
+                return result
+        raise NoTranscript("no transcript available for %s" % url)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+TOKEN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]|\w+|[^\w\s]")
+
+LENGTHS = {
+    "short": "in 2-3 sentences",
+    "medium": "in one or two paragraphs",
+    "long": "in detail, covering every main point",
+}
+STYLES = {
+    "paragraph": "Write flowing prose.",
+    "bullets": "Write a bulleted list.",
+}
+
+# map段のプロンプトは長さ・文体に依存させない（変えてもチャンク要約を再利用できる）
+MAP_PROMPT = (
+    "Summarize the following part of a video transcript, keeping every important fact, "
+    "name and number. Respond in the same language as the transcript.\n\n{text}"
+)
+COMBINE_PROMPT = (
+    "Merge the following partial summaries of one video into a single summary, keeping every "
+    "important fact. Respond in the same language as the summaries.\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive parts of one video. Write a summary of the "
+    "whole video {length}. {style} Respond in the same language as the summaries.\n\n{text}"
+)
+
+
+def count_tokens(text):
+    # 概算（CJKは1文字1トークン、それ以外は単語と記号）
+    return len(TOKEN_RE.findall(text))
+
+
+def split_chunks(pieces, max_tokens):
+    # セグメントの切れ目で、max_tokensを超えないようにまとめる
+    chunks = []
+    current = []
+    size = 0
+    for piece in pieces:
+        for part in split_long(piece, max_tokens):
+            n = count_tokens(part)
+            if current and size + n > max_tokens:
+                chunks.append(" ".join(current))
+                current, size = [], 0
+            current.append(part)
+            size += n
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def split_long(text, max_tokens):
+    # 1つのセグメントが長すぎるときはトークン数で切る（元の文字列のまま）
+    starts = [m.start() for m in TOKEN_RE.finditer(text)]
+    if len(starts) <= max_tokens:
+        return [text]
+    cuts = starts[::max_tokens][1:] + [len(text)]
+    return [text[a:b].strip() for a, b in zip([0] + cuts[:-1], cuts)]
+
+
+class StubBackend:
+    # オフライン用。本文の先頭を切り出すだけの決定的な要約
+    name = "stub"
+
+    def __init__(self, max_tokens=40):
+        self.max_tokens = max_tokens
+
+    def complete(self, prompt):
+        text = prompt.split("\n\n", 1)[-1]
+        return split_long(text, self.max_tokens)[0]
+
+
+class OpenAIBackend:
+    def __init__(self, model="gpt-4o-mini"):
+        from openai import OpenAI
+        self.client = OpenAI()
+        self.model = model
+        self.name = "openai:%s" % model
+
+    def complete(self, prompt):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+        )
+        return response.choices[0].message.content.strip()
+
+
+class Summarizer:
+    # 長い文字起こしをチャンクごとに並列で要約し（map）、最後にまとめる（reduce）
+    def __init__(self, backend, cache=None, max_chunk_tokens=2000, workers=4):
+        self.backend = backend
+        self.cache = cache
+        self.max_chunk_tokens = max_chunk_tokens
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary")
+
+    def _complete(self, prompt):
+        # プロンプトとバックエンドが同じなら結果を使い回す
+        if self.cache is None:
+            return self.backend.complete(prompt)
+        key = hashlib.sha256(json.dumps([self.backend.name, prompt]).encode("utf-8")).hexdigest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.backend.complete(prompt)
+        self.cache.put(key, result)
+        return result
+
+    def _map(self, template, texts):
+        return list(self.executor.map(lambda text: self._complete(template.format(text=text)), texts))
+
+    def check(self, length, style):
+        # JSONで配列などが来ても辞書を引く前に弾く
+        if not isinstance(length, str) or length not in LENGTHS:
+            raise ValueError("unknown length: %r" % (length,))
+        if not isinstance(style, str) or style not in STYLES:
+            raise ValueError("unknown style: %r" % (style,))
+
+    def summarize(self, transcript, length="medium", style="paragraph"):
+        self.check(length, style)
+        pieces = [s["text"] for s in transcript["segments"]] or [transcript["text"]]
+        chunks = split_chunks([p for p in pieces if p.strip()], self.max_chunk_tokens)
+        if not chunks:
+            # 空の文字起こしはLLMに送らない
+            return {"summary": "", "chunks": 0, "length": length, "style": style}
+        partials = self._map(MAP_PROMPT, chunks)
+
+        # 部分要約がまだ長すぎる場合は段階的にまとめる
+        while len(partials) > 1 and count_tokens("\n\n".join(partials)) > self.max_chunk_tokens:
+            groups = split_chunks(partials, self.max_chunk_tokens)
+            if len(groups) >= len(partials):
+                break
+            partials = self._map(COMBINE_PROMPT, groups)
+
+        summary = self._complete(REDUCE_PROMPT.format(
+            length=LENGTHS[length], style=STYLES[style], text="\n\n".join(partials),
+        ))
+        return {"summary": summary, "chunks": len(chunks), "length": length, "style": style}
@@ -0,0 +1,84 @@
+import os
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+THRESHOLD = 0.05
+FRAME = SAMPLE_RATE // 100
+
+
+def make_speech(n_words, word_seconds=0.5, gap_seconds=0.3):
+    # 単語の代わりに振幅で番号を表した矩形波を並べる（w0, w1, ...）
+    word = int(word_seconds * SAMPLE_RATE)
+    gap = int(gap_seconds * SAMPLE_RATE)
+    square = np.sign(np.sin(2 * np.pi * 200 * np.arange(word) / SAMPLE_RATE))
+    square[square == 0] = 1
+    pieces = [np.zeros(gap)]
+    for k in range(n_words):
+        pieces.append(square * amplitude(k))
+        pieces.append(np.zeros(gap))
+    return np.concatenate(pieces).astype(np.float32)
+
+
+def amplitude(k):
+    return 0.1 + 0.002 * (k % 400)
+
+
+def words(n_words):
+    return " ".join("w%d" % (k % 400) for k in range(n_words))
+
+
+def write_wav(path, audio):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+def read_wav(path):
+    with wave.open(str(path), "rb") as f:
+        data = f.readframes(f.getnframes())
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768
+
+
+class StubModel:
+    # 振幅から単語番号を読み取るだけのWhisperの代役
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        self.calls.append(options)
+        frames = len(audio) // FRAME
+        levels = np.abs(audio[:frames * FRAME]).reshape(frames, FRAME).max(axis=1)
+        segments = []
+        start = None
+        for i in range(frames + 1):
+            loud = i < frames and levels[i] > THRESHOLD
+            if loud and start is None:
+                start = i
+            elif not loud and start is not None:
+                run = np.abs(audio[start * FRAME:i * FRAME])
+                k = int(round((np.median(run[run > THRESHOLD]) - 0.1) / 0.002))
+                segments.append({"start": start * FRAME / SAMPLE_RATE, "end": i * FRAME / SAMPLE_RATE,
+                                 "text": " w%d" % k})
+                start = None
+        return {
+            "text": "".join(s["text"] for s in segments),
+            "segments": segments,
+            "language": options.get("language") or "en",
+        }
+
+
+def load_stub_model(name):
+    return StubModel()
+
+
+def load_stub_model_or_crash(name):
+    # 最初の1回だけワーカープロセスを落とす（OOMで殺された場合の代わり）
+    marker = os.environ["STUB_CRASH_MARKER"]
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return StubModel()
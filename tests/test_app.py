@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+
+import pytest
+
+from jobs import DONE, FAILED, Job, JobQueue
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    root = tmp_path_factory.mktemp("app")
+    mp = pytest.MonkeyPatch()
+    mp.setenv("CACHE_DIR", str(root / "cache"))
+    mp.setenv("AUDIO_WORK_DIR", str(root / "audio"))
+    mp.delenv("OPENAI_API_KEY", raising=False)
+    import app
+    yield app.app.test_client()
+    mp.undo()
+
+
+@pytest.mark.parametrize("path", ["/jobs", "/batches"])
+@pytest.mark.parametrize("body", [["https://youtu.be/dQw4w9WgXcQ"], "https://youtu.be/dQw4w9WgXcQ", 42])
+def test_non_object_json_body_is_rejected(client, path, body):
+    response = client.post(path, json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_batch_urls_must_be_strings(client):
+    response = client.post("/batches", json={"urls": [1, 2]})
+    assert response.status_code == 400
+
+
+def test_unknown_model_is_rejected(client):
+    response = client.post("/jobs", json={"url": "https://youtu.be/dQw4w9WgXcQ", "model": "huge"})
+    assert response.status_code == 400
+
+
+def events(response):
+    # SSEの本文を (id, event, data) の並びにする
+    parsed = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            parsed.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def segments(n):
+    return [{"start": float(i), "end": i + 1.0, "text": "s%d" % i} for i in range(n)]
+
+
+def test_events_stream_segments_then_done(client):
+    import app
+    result = {"text": "s0 s1 s2", "segments": segments(3), "source": "whisper", "language": "en"}
+    job = app.queue.add_done("https://youtu.be/dQw4w9WgXcQ", result, result["segments"], "tiny")
+    parsed = events(client.get("/jobs/%s/events" % job.id))
+    assert [(i, e) for i, e, _ in parsed if e == "segment"] == [("1", "segment"), ("2", "segment"), ("3", "segment")]
+    assert parsed[-1] == (None, "done", {"transcript": "s0 s1 s2", "source": "whisper"})
+
+
+def test_events_resume_after_last_event_id(client):
+    import app
+    result = {"text": "", "segments": segments(3), "source": "whisper", "language": "en"}
+    job = app.queue.add_done("https://youtu.be/dQw4w9WgXcQ", result, result["segments"], "tiny")
+    parsed = events(client.get("/jobs/%s/events" % job.id, headers={"Last-Event-ID": "2"}))
+    assert [(i, d["text"]) for i, e, d in parsed if e == "segment"] == [("3", "s2")]
+    assert parsed[-1][1] == "done"
+
+
+def test_events_report_failure(client):
+    import app
+    job = app.queue.register(Job("https://youtu.be/dQw4w9WgXcQ", "tiny"))
+    job.finish(FAILED, error="boom")
+    parsed = events(client.get("/jobs/%s/events" % job.id))
+    assert parsed[-1] == (None, "failed", {"error": "boom"})
+
+
+def test_events_stream_is_bounded(client, monkeypatch):
+    import app
+    monkeypatch.setattr(app, "SSE_MAX_SECONDS", 0.2)
+    job = app.queue.register(Job("https://youtu.be/dQw4w9WgXcQ", "tiny"))
+    job.add_segments(segments(1))
+    start = time.monotonic()
+    response = client.get("/jobs/%s/events" % job.id)
+    parsed = events(response)
+    # 未完了のままでも接続を切り、再接続はLast-Event-IDで続きから受け取る
+    assert time.monotonic() - start < 5
+    assert response.get_data(as_text=True).startswith("retry: ")
+    assert [e for _, e, _ in parsed] == ["segment", "status"]
+    job.add_segments(segments(2)[1:])
+    job.finish(DONE, {"text": "", "segments": segments(2), "source": "whisper", "language": "en"})
+    parsed = events(client.get("/jobs/%s/events" % job.id, headers={"Last-Event-ID": "1"}))
+    assert [(i, e) for i, e, _ in parsed] == [("2", "segment"), (None, "status"), (None, "done")]
+
+
+def test_events_unknown_job(client):
+    assert client.get("/jobs/missing/events").status_code == 404
+
+
+def done_job(text="s0 s1 s2"):
+    import app
+    result = {"text": text, "segments": segments(len(text.split())), "source": "whisper", "language": "en"}
+    return app.queue.add_done("https://youtu.be/dQw4w9WgXcQ", result, result["segments"], "tiny")
+
+
+def test_summary_without_backend_is_unavailable(client):
+    # OPENAI_API_KEYがなければスタブで代用せず、要約は使えないと返す
+    job = done_job()
+    response = client.post("/jobs/%s/summary" % job.id, json={})
+    assert response.status_code == 503
+    import app
+    app.cache.put(app.transcript_key(job.url, "tiny"), job.result)  # キャッシュから即完了させる
+    page = client.post("/", data={"url": job.url, "model": "tiny"}).get_data(as_text=True)
+    assert "文字起こし結果" in page
+    assert "summary-box" not in page
+
+
+@pytest.fixture
+def stub_summaries(client, monkeypatch):
+    import app
+    from summarize import StubBackend, Summarizer
+    monkeypatch.setattr(app, "summarizer", Summarizer(StubBackend()))
+
+
+def test_summary_runs_as_a_job(client, stub_summaries):
+    job = done_job()
+    response = client.post("/jobs/%s/summary" % job.id, json={"length": "short", "style": "bullets"})
+    assert response.status_code == 202
+    summary_id = response.get_json()["id"]
+    deadline = time.monotonic() + 5
+    data = client.get("/summaries/%s" % summary_id).get_json()
+    while data["status"] not in (DONE, FAILED) and time.monotonic() < deadline:
+        time.sleep(0.01)
+        data = client.get("/summaries/%s" % summary_id).get_json()
+    assert data["status"] == DONE
+    assert (data["summary"], data["length"], data["style"], data["source_job"]) == ("s0 s1 s2", "short", "bullets", job.id)
+
+
+@pytest.mark.parametrize("body", [{"length": ["x"]}, {"style": {"a": 1}}, {"length": "huge"}, {"length": 3}])
+def test_summary_options_are_validated(client, stub_summaries, body):
+    job = done_job()
+    response = client.post("/jobs/%s/summary" % job.id, json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_unknown_summary(client):
+    assert client.get("/summaries/missing").status_code == 404
+
+
+def test_job_endpoints_with_stub_handler(client, monkeypatch):
+    import app
+    release = threading.Event()
+
+    def handler(job):
+        release.wait(5)
+        return {"text": "hello", "segments": segments(1), "source": "whisper", "language": "en"}
+
+    monkeypatch.setattr(app, "queue", JobQueue(handler))
+    response = client.post("/jobs", json={"url": "https://youtu.be/aaaaaaaaaaa", "model": "tiny"})
+    assert response.status_code == 202
+    job_id = response.get_json()["id"]
+    assert client.get("/jobs/%s/transcript" % job_id).status_code == 409
+    release.set()
+    deadline = time.monotonic() + 5
+    while client.get("/jobs/%s" % job_id).get_json()["status"] != DONE and time.monotonic() < deadline:
+        time.sleep(0.01)
+    data = client.get("/jobs/%s/transcript" % job_id).get_json()
+    assert (data["transcript"], data["source"], data["language"]) == ("hello", "whisper", "en")
+    assert client.get("/jobs/missing").status_code == 404
+
+
+def test_cached_job_is_done_immediately(client):
+    import app
+    url = "https://youtu.be/bbbbbbbbbbb"
+    app.cache.put(app.transcript_key(url, "tiny"), {"text": "cached", "segments": segments(1), "source": "captions", "language": "ja"})
+    response = client.post("/jobs", json={"url": url, "model": "tiny"})
+    assert response.status_code == 202
+    assert response.get_json()["status"] == DONE
+
+
+def test_cache_counters_are_exported_as_counters(client):
+    text = client.get("/metrics").get_data(as_text=True)
+    for name in ("hits", "misses", "evictions"):
+        assert "# TYPE transcriber_cache_%s_total counter" % name in text
+        assert "transcriber_cache_%s " % name not in text
+    assert "# TYPE transcriber_cache_entries gauge" in text
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from audio import AudioUnavailable, AudioWorkspace
+
+MB = 1024 * 1024
+
+
+def workspace(root, **kwargs):
+    kwargs.setdefault("wait_timeout", 5)
+    return AudioWorkspace(str(root / "work"), quota_bytes=2 * MB, max_download_bytes=MB, poll_interval=0.02, **kwargs)
+
+
+def test_job_dirs_wait_for_quota(tmp_path):
+    ws = workspace(tmp_path)
+    entered = []
+    with ws.job_dir(), ws.job_dir():
+        t = threading.Thread(target=lambda: entered.append(ws.job_dir().__enter__()))
+        t.start()
+        time.sleep(0.1)
+        # 枠が埋まっている間は待たされる
+        assert entered == []
+    t.join(5)
+    assert len(entered) == 1
+
+
+def test_job_dir_times_out(tmp_path):
+    ws = workspace(tmp_path, wait_timeout=0.1)
+    with ws.job_dir(), ws.job_dir():
+        with pytest.raises(AudioUnavailable):
+            with ws.job_dir():
+                pass
+    with ws.job_dir() as directory:
+        assert directory.startswith(str(tmp_path / "work"))
+
+
+def test_quota_is_shared_between_workspaces(tmp_path):
+    # gunicornの別ワーカーと同じく、同じrootを使う別インスタンスとも枠を分け合う
+    first = workspace(tmp_path)
+    second = workspace(tmp_path, wait_timeout=0.1)
+    with first.job_dir(), first.job_dir():
+        with pytest.raises(AudioUnavailable):
+            with second.job_dir():
+                pass
+    with second.job_dir(), second.job_dir():
+        pass
+
+
+def test_sweep_removes_stale_dirs(tmp_path):
+    ws = workspace(tmp_path)
+    with ws.job_dir():
+        pass
+    (tmp_path / "work" / "stale").mkdir()
+    ws.sweep(older_than=-1)
+    assert list((tmp_path / "work").iterdir()) == []
+    assert (tmp_path / "work.lock").exists()
@@ -0,0 +1,96 @@
+import os
+import time
+
+import numpy as np
+
+from batch import BatchRunner
+from jobs import DONE, JobQueue
+
+
+def prepare_audio(job):
+    # すべて音声からの文字起こしに回す
+    return None
+
+
+def acquire(job):
+    return np.zeros(16000, dtype=np.float32)
+
+
+def infer(job, audio):
+    return {"text": job.url, "segments": [], "source": "whisper", "language": "en"}
+
+
+def expand(url):
+    return [(url.rsplit("/", 1)[-1], url)]
+
+
+def wait_done(runner, batch, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if runner.get(batch.id).status == "done":
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def make_runner():
+    return BatchRunner(JobQueue(lambda job: None), prepare_audio, acquire, infer, prefetch=1, expand=expand)
+
+
+def test_batch_runs_through_both_stages():
+    runner = make_runner()
+    batch = runner.submit(["https://youtu.be/a", "https://youtu.be/b", "https://youtu.be/a"], "tiny")
+    assert wait_done(runner, batch)
+    assert [job.status for _, job in batch.items] == [DONE, DONE]
+
+
+def test_batch_runs_after_fork():
+    # gunicorn --preload と同じく、作成後にforkした子プロセスで処理できること
+    runner = make_runner()
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            batch = runner.submit(["https://youtu.be/%d" % i for i in range(5)], "tiny")
+            ok = wait_done(runner, batch) and all(job.status == DONE for _, job in batch.items)
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+
+def test_expand_errors_are_recorded_per_url():
+    def flaky_expand(url):
+        if "broken" in url:
+            raise RuntimeError("yt-dlp failed")
+        return expand(url)
+
+    runner = BatchRunner(JobQueue(lambda job: None), prepare_audio, acquire, infer, expand=flaky_expand)
+    batch = runner.submit(["https://youtu.be/a", "https://youtube.com/playlist?list=broken"], "tiny")
+    assert wait_done(runner, batch)
+    assert len(batch.items) == 1
+    assert batch.to_dict()["errors"] == [{"url": "https://youtube.com/playlist?list=broken", "error": "yt-dlp failed"}]
+
+    batch = runner.submit(["https://youtube.com/playlist?list=broken"], "tiny")
+    deadline = time.time() + 5
+    while runner.get(batch.id).status == "expanding" and time.time() < deadline:
+        time.sleep(0.01)
+    assert batch.status == "failed"
+
+
+def test_long_batch_does_not_block_later_batches():
+    def prepare(job):
+        if "cached" in job.url:
+            return infer(job, None)
+        return None
+
+    def slow_infer(job, audio):
+        time.sleep(0.2)
+        return infer(job, audio)
+
+    runner = BatchRunner(JobQueue(lambda job: None), prepare, acquire, slow_infer, prefetch=1, expand=expand)
+    runner.submit(["https://youtu.be/%d" % i for i in range(10)], "tiny")
+    time.sleep(0.1)
+    # 先のバッチの推論待ちがあっても、キャッシュで済むバッチはすぐ終わる
+    batch = runner.submit(["https://youtu.be/cached"], "tiny")
+    assert wait_done(runner, batch, timeout=1)
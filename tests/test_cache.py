@@ -0,0 +1,85 @@
+import pytest
+
+from cache import TranscriptCache, cache_key, extract_video_id
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize("url", [
+    VIDEO_ID,
+    "https://youtu.be/dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?t=30",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=30",
+    "https://youtube.com/watch?t=30&v=dQw4w9WgXcQ",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    "https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ",
+    "youtube.com/watch?v=dQw4w9WgXcQ",
+])
+def test_video_id_is_normalized(url):
+    assert extract_video_id(url) == VIDEO_ID
+
+
+@pytest.mark.parametrize("url", [
+    "https://evilyoutube.com/watch?v=dQw4w9WgXcQ",
+    "https://attacker-youtube-nocookie.com/embed/dQw4w9WgXcQ",
+    "https://youtube.com.evil.example/watch?v=dQw4w9WgXcQ",
+    "https://notyoutu.be/dQw4w9WgXcQ",
+    "https://example.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=short",
+    "https://www.youtube.com/playlist?list=PL123",
+    "",
+    None,
+])
+def test_other_urls_have_no_video_id(url):
+    assert extract_video_id(url) is None
+
+
+def test_cache_key_depends_on_model_and_options():
+    assert cache_key(VIDEO_ID, "tiny") == cache_key(VIDEO_ID, "tiny", {})
+    assert cache_key(VIDEO_ID, "tiny") != cache_key(VIDEO_ID, "base")
+    assert cache_key(VIDEO_ID, "tiny", {"a": 1}) != cache_key(VIDEO_ID, "tiny", {"a": 2})
+
+
+def entry(n):
+    return {"text": "x" * n}
+
+
+def test_lru_eviction_and_stats(tmp_path):
+    size = len('{"text": ""}') + 100
+    cache = TranscriptCache(str(tmp_path), max_bytes=size * 2, memory_items=1)
+    cache.put("a", entry(100))
+    cache.put("b", entry(100))
+    assert cache.get("a") == entry(100)  # aを最近使ったことにする
+    cache.put("c", entry(100))
+    assert cache.get("b") is None
+    assert cache.get("a") == entry(100)
+    assert cache.get("c") == entry(100)
+    assert cache.stats() == {
+        "hits": 3,
+        "misses": 1,
+        "entries": 2,
+        "memory_entries": 1,
+        "bytes": size * 2,
+        "max_bytes": size * 2,
+        "evictions": 1,
+    }
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.json", "c.json"]
+
+
+def test_index_survives_restart(tmp_path):
+    cache = TranscriptCache(str(tmp_path), max_bytes=10000)
+    cache.put("a", entry(10))
+    reopened = TranscriptCache(str(tmp_path), max_bytes=10000)
+    assert reopened.get("a") == entry(10)
+    assert reopened.stats()["memory_entries"] == 1
+
+
+def test_corrupt_file_is_a_miss(tmp_path):
+    cache = TranscriptCache(str(tmp_path), max_bytes=10000, memory_items=0)
+    cache.put("a", entry(10))
+    (tmp_path / "a.json").write_text("{broken")
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+import chunking
+from chunking import (
+    SAMPLE_RATE, ChunkedTranscriber, chunk_bounds, dedupe, plan_chunks, select_segments, word_error_rate,
+)
+from models import ModelRegistry
+from stubs import StubModel, load_stub_model, load_stub_model_or_crash, make_speech, words
+
+
+def test_plan_chunks_covers_audio_with_overlap():
+    audio = make_speech(100)
+    chunks = plan_chunks(audio, chunk_seconds=10, overlap_seconds=2)
+
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(audio)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end - start == 2 * SAMPLE_RATE
+    for start, end in chunks:
+        assert end - start <= 11 * SAMPLE_RATE
+
+
+def test_plan_chunks_cuts_at_silence():
+    audio = make_speech(100)
+    chunks = plan_chunks(audio, chunk_seconds=10, overlap_seconds=2)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        cut = (start + end) // 2
+        assert abs(audio[cut]) == 0
+
+
+def test_plan_chunks_short_audio_is_one_chunk():
+    audio = np.zeros(5 * SAMPLE_RATE, dtype=np.float32)
+    assert plan_chunks(audio, chunk_seconds=10) == [(0, len(audio))]
+
+
+def test_chunk_bounds_are_contiguous():
+    chunks = [(0, 12 * SAMPLE_RATE), (10 * SAMPLE_RATE, 22 * SAMPLE_RATE), (20 * SAMPLE_RATE, 25 * SAMPLE_RATE)]
+    assert chunk_bounds(chunks) == [(0.0, 11.0), (11.0, 21.0), (21.0, float("inf"))]
+
+
+def test_select_segments_uses_global_timestamps():
+    segments = [
+        {"start": 0.2, "end": 0.8, "text": " in overlap"},
+        {"start": 1.5, "end": 2.0, "text": " kept "},
+        {"start": 3.0, "end": 3.5, "text": "   "},
+        {"start": 9.5, "end": 10.0, "text": " next chunk"},
+    ]
+    assert select_segments(segments, offset=10.0, lo=11.0, hi=19.0) == [
+        {"start": 11.5, "end": 12.0, "text": "kept"},
+    ]
+
+
+def test_dedupe_drops_repeated_boundary_sentence():
+    previous = [{"start": 10.0, "end": 11.0, "text": "Hello, world."}]
+    segments = [{"start": 11.0, "end": 11.5, "text": "hello world"}, {"start": 12.0, "end": 13.0, "text": "next"}]
+    assert dedupe(previous, segments) == segments[1:]
+    assert dedupe([], segments) == segments
+
+
+def test_word_error_rate():
+    assert word_error_rate("a b c d", "a b c d") == 0.0
+    assert word_error_rate("a b c d", "a x c") == 0.5
+    assert word_error_rate("", "") == 0.0
+
+
+def transcribe(workers, audio):
+    transcriber = ChunkedTranscriber(ModelRegistry(["tiny"], load=load_stub_model), workers=workers,
+                                     chunk_seconds=10, overlap_seconds=2)
+    streamed = []
+    try:
+        segments, language = transcriber.transcribe(audio, "tiny", lambda s, done: streamed.extend(s))
+    finally:
+        transcriber.close()
+    assert streamed == segments
+    return segments, language
+
+
+def test_parallel_matches_sequential():
+    audio = make_speech(150)
+    sequential, seq_language = transcribe(1, audio)
+    parallel, par_language = transcribe(2, audio)
+    seq_text = " ".join(s["text"] for s in sequential)
+    par_text = " ".join(s["text"] for s in parallel)
+
+    assert word_error_rate(seq_text, par_text) < 0.02
+    assert word_error_rate(words(150), par_text) < 0.02
+    assert par_language == seq_language
+    # 時刻は全体の時刻で、順番に並んでいる
+    starts = [s["start"] for s in parallel]
+    assert starts == sorted(starts)
+    assert parallel[-1]["end"] == pytest.approx(len(audio) / SAMPLE_RATE - 0.3, abs=0.05)
+
+
+def test_sequential_locks_language_after_first_chunk():
+    model = StubModel()
+    transcriber = ChunkedTranscriber(ModelRegistry(["tiny"], load=lambda name: model), chunk_seconds=10)
+    transcriber.transcribe(make_speech(40), "tiny")
+    assert "language" not in model.calls[0]
+    assert all(call["language"] == "en" for call in model.calls[1:])
+
+
+def test_pool_tasks_receive_language():
+    chunking._init_worker(["tiny"], load_stub_model, {}, 1)
+    _, language = chunking._transcribe_chunk("tiny", make_speech(2), "ja")
+    assert language == "ja"
+
+
+def test_broken_pool_is_replaced(tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_CRASH_MARKER", str(tmp_path / "crashed"))
+    transcriber = ChunkedTranscriber(ModelRegistry(["tiny"], load=load_stub_model_or_crash), workers=2,
+                                     chunk_seconds=10, overlap_seconds=2)
+    try:
+        segments, _ = transcriber.transcribe(make_speech(40), "tiny")
+    finally:
+        transcriber.close()
+    assert (tmp_path / "crashed").exists()
+    assert word_error_rate(words(40), " ".join(s["text"] for s in segments)) < 0.05
+
+
+@pytest.mark.parametrize("overlap", [10, 12, -1])
+def test_overlap_must_be_shorter_than_chunk(overlap):
+    with pytest.raises(ValueError):
+        ChunkedTranscriber(ModelRegistry(["tiny"], load=load_stub_model), chunk_seconds=10, overlap_seconds=overlap)
@@ -0,0 +1,87 @@
+import threading
+
+from jobs import DONE, FAILED, QUEUED, RUNNING, Job, JobQueue
+
+
+def wait_finished(job, timeout=5):
+    with job.changed:
+        assert job.changed.wait_for(lambda: job.finished_at is not None, timeout)
+
+
+def test_submit_runs_handler_in_background():
+    release = threading.Event()
+    started = threading.Event()
+
+    def handler(job):
+        started.set()
+        release.wait(5)
+        job.add_segments([{"start": 0.0, "end": 1.0, "text": "hello"}])
+        return {"text": "hello", "model": job.model}
+
+    queue = JobQueue(handler)
+    job = queue.submit("https://youtu.be/dQw4w9WgXcQ", "tiny")
+    assert queue.get(job.id) is job
+    assert started.wait(5)
+    assert job.status == RUNNING
+    assert job.started_at is not None
+    release.set()
+    wait_finished(job)
+    assert job.status == DONE
+    assert job.stage == DONE
+    assert job.progress == 1.0
+    assert job.result == {"text": "hello", "model": "tiny"}
+    assert job.segments == [{"start": 0.0, "end": 1.0, "text": "hello"}]
+
+
+def test_jobs_wait_for_a_free_worker():
+    release = threading.Event()
+    queue = JobQueue(lambda job: release.wait(5), workers=1)
+    first = queue.submit("a")
+    second = queue.submit("b")
+    assert second.status == QUEUED
+    release.set()
+    wait_finished(first)
+    wait_finished(second)
+    assert (first.status, second.status) == (DONE, DONE)
+
+
+def test_handler_errors_fail_the_job():
+    def handler(job):
+        raise RuntimeError("download failed")
+
+    queue = JobQueue(handler)
+    job = queue.submit("https://youtu.be/dQw4w9WgXcQ")
+    wait_finished(job)
+    assert job.status == FAILED
+    assert job.error == "download failed"
+    assert job.result is None
+    assert job.to_dict()["error"] == "download failed"
+
+
+def test_add_done_skips_the_queue():
+    queue = JobQueue(lambda job: 1 / 0)
+    job = queue.add_done("https://youtu.be/dQw4w9WgXcQ", {"text": "cached"}, [{"text": "cached"}], "tiny")
+    assert job.status == DONE
+    assert job.segments == [{"text": "cached"}]
+    assert queue.get(job.id) is job
+
+
+def test_trim_drops_oldest_finished_jobs_only():
+    queue = JobQueue(lambda job: None, max_jobs=2)
+    running = queue.register(Job("running"))
+    old = queue.add_done("old", {})
+    new = queue.add_done("new", {})
+    # 実行中のジョブは上限を超えても残す
+    assert queue.get(running.id) is running
+    assert queue.get(old.id) is None
+    assert queue.get(new.id) is new
+    newest = queue.register(Job("queued"))
+    assert queue.get(new.id) is None
+    assert list(queue.jobs) == [running.id, newest.id]
+
+
+def test_wait_returns_on_new_segments():
+    job = Job("a")
+    threading.Timer(0.05, job.add_segments, args=([{"text": "x"}],)).start()
+    job.wait(0, job.stage, timeout=5)
+    assert len(job.segments) == 1
@@ -0,0 +1,66 @@
+import re
+
+from metrics import Metrics
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"(?:,|$)')
+
+
+def unescape(value):
+    return re.sub(r'\\(.)', lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+def parse(text):
+    # Prometheusのテキスト形式を (TYPE一覧, サンプル一覧) に分解する
+    types = {}
+    samples = []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            types[name] = kind
+        elif line and not line.startswith("#"):
+            match = SAMPLE_RE.match(line)
+            assert match, line
+            name, raw_labels, value = match.groups()
+            labels = {}
+            if raw_labels:
+                pairs = LABEL_RE.findall(raw_labels)
+                assert "".join('%s="%s",' % p for p in pairs) == raw_labels + ",", line
+                labels = {k: unescape(v) for k, v in pairs}
+            samples.append((name, labels, float(value)))
+    return types, samples
+
+
+def family(name, types):
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and types.get(name[:-len(suffix)]) == "histogram":
+            return name[:-len(suffix)]
+    return name
+
+
+def test_render_is_valid_exposition():
+    metrics = Metrics()
+    for seconds in (0.01, 0.3, 0.3, 7, 4000):
+        metrics.stages.observe(seconds, (("stage", 'we"ird\\stage\nname'), ("status", "ok")))
+    metrics.observe_rtf(3, 10, "tiny")
+    metrics.job_finished("done")
+    metrics.set_counter("transcriber_cache_hits_total", 5, "Transcript cache hits.")
+    types, samples = parse(metrics.render())
+
+    # すべてのサンプルにTYPEがあり、counterは_totalで終わる
+    for name, _, _ in samples:
+        assert family(name, types) in types
+    assert all(name.endswith("_total") for name, kind in types.items() if kind == "counter")
+    assert types["transcriber_cache_hits_total"] == "counter"
+
+    # ラベルのエスケープが元に戻る
+    stages = [(labels, value) for name, labels, value in samples if name == "transcriber_stage_seconds_bucket"]
+    assert {labels["stage"] for labels, _ in stages} == {'we"ird\\stage\nname'}
+
+    # バケットは単調増加で、+Infは_countと一致する
+    counts = [value for _, value in stages]
+    assert counts == sorted(counts)
+    assert stages[-1][0]["le"] == "+Inf"
+    count = [value for name, _, value in samples if name == "transcriber_stage_seconds_count"]
+    assert counts[-1] == count[0] == 5
+    assert counts[0] == 1
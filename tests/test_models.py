@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from chunking import ChunkedTranscriber
+from models import ModelRegistry, UnknownModel
+from stubs import StubModel, make_speech
+
+
+def test_models_load_lazily_with_lru_unloading():
+    loaded = []
+    registry = ModelRegistry(["tiny", "base", "small"], max_resident=2, load=lambda name: loaded.append(name) or name)
+    assert registry.resident() == []
+    registry.get("tiny")
+    registry.get("base")
+    registry.get("tiny")
+    registry.get("small")
+    assert loaded == ["tiny", "base", "small"]
+    assert registry.resident() == ["tiny", "small"]
+    with pytest.raises(UnknownModel):
+        registry.get("large")
+
+
+class ExclusiveModel(StubModel):
+    # 同じモデルへの同時推論を検出する
+    def __init__(self):
+        super().__init__()
+        self.active = 0
+        self.overlapped = False
+
+    def transcribe(self, audio, **options):
+        self.active += 1
+        if self.active > 1:
+            self.overlapped = True
+        time.sleep(0.005)
+        try:
+            return super().transcribe(audio, **options)
+        finally:
+            self.active -= 1
+
+
+def test_inference_is_serialized_per_model():
+    model = ExclusiveModel()
+    registry = ModelRegistry(["tiny"], load=lambda name: model)
+    transcriber = ChunkedTranscriber(registry, chunk_seconds=5)
+    audio = make_speech(30)
+    threads = [threading.Thread(target=transcriber.transcribe, args=(audio, "tiny")) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(model.calls) > 4
+    assert not model.overlapped
+
+
+def test_pinned_model_is_not_unloaded():
+    loaded = []
+    registry = ModelRegistry(["tiny", "base"], max_resident=1, load=lambda name: loaded.append(name) or name)
+    resident = []
+    with registry.using("tiny"):
+        t = threading.Thread(target=registry.get, args=("base",))
+        t.start()
+        time.sleep(0.05)
+        # 使用中のtinyは外されず、baseは枠が空くまで読み込まれない
+        assert t.is_alive()
+        resident.append(registry.resident())
+        assert registry.get("tiny") == "tiny"
+    t.join(1)
+    assert not t.is_alive()
+    assert resident == [["tiny"]]
+    assert loaded == ["tiny", "base"]
+    assert registry.resident() == ["base"]
+
+
+def test_same_model_is_shared_between_users():
+    loaded = []
+    registry = ModelRegistry(["tiny"], max_resident=1, load=lambda name: loaded.append(name) or object())
+    with registry.pinned("tiny") as a, registry.pinned("tiny") as b:
+        assert a is b
+    assert loaded == ["tiny"]
+    assert registry.pins == {}
+
+
+def test_failed_load_frees_the_slot():
+    def load(name):
+        if name == "base":
+            raise RuntimeError("out of memory")
+        return name
+
+    registry = ModelRegistry(["tiny", "base"], max_resident=1, load=load)
+    with pytest.raises(RuntimeError):
+        registry.get("base")
+    assert registry.get("tiny") == "tiny"
+
+
+def test_jobs_on_different_models_do_not_thrash():
+    loaded = []
+
+    def load(name):
+        loaded.append(name)
+        return StubModel()
+
+    registry = ModelRegistry(["tiny", "base"], max_resident=1, load=load)
+    transcriber = ChunkedTranscriber(registry, chunk_seconds=5)
+    audio = make_speech(30)
+    threads = [threading.Thread(target=transcriber.transcribe, args=(audio, name)) for name in ("tiny", "base")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # チャンクごとに読み直さず、ジョブごとに1回だけ読み込む
+    assert sorted(loaded) == ["base", "tiny"]
@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import sources
+from audio import AudioWorkspace
+from chunking import ChunkedTranscriber
+from jobs import Job
+from models import ModelRegistry
+from sources import CaptionSource, NoTranscript, TranscriptPipeline, WhisperSource, fetch_youtube_captions
+from stubs import load_stub_model, make_speech, read_wav, words, write_wav
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def fixture_captions(video_id, languages):
+    with open(os.path.join(FIXTURES, "captions.json"), encoding="utf-8") as f:
+        return json.load(f), "ja"
+
+
+def no_captions(video_id, languages):
+    return None, None
+
+
+def make_pipeline(tmp_path, fetch, audio_path=None):
+    def copy_fixture(url, directory, max_bytes):
+        path = os.path.join(directory, "audio.wav")
+        shutil.copyfile(audio_path, path)
+        return path
+
+    workspace = AudioWorkspace(str(tmp_path / "work"), quota_bytes=10 ** 8, max_download_bytes=10 ** 7,
+                               download=copy_fixture, decode=read_wav)
+    transcriber = ChunkedTranscriber(ModelRegistry(["tiny"], load=load_stub_model), chunk_seconds=5,
+                                     overlap_seconds=1)
+    return TranscriptPipeline([CaptionSource(["ja", "en"], fetch=fetch), WhisperSource(transcriber, workspace.fetch)])
+
+
+def test_captions_are_used_when_present(tmp_path):
+    pipeline = make_pipeline(tmp_path, fixture_captions)
+    job = Job("https://youtu.be/dQw4w9WgXcQ", "tiny")
+    result = pipeline.run(job.url, "dQw4w9WgXcQ", job)
+
+    assert result["source"] == "captions"
+    assert result["language"] == "ja"
+    assert result["segments"] == [
+        {"start": 0.0, "end": 2.5, "text": "こんにちは、今日は字幕のテストです。"},
+        {"start": 2.5, "end": 4.5, "text": "二行目の字幕です。"},
+    ]
+    assert job.segments == result["segments"]
+
+
+def test_whisper_is_used_without_captions(tmp_path):
+    audio_path = tmp_path / "speech.wav"
+    write_wav(audio_path, make_speech(30))
+    pipeline = make_pipeline(tmp_path, no_captions, str(audio_path))
+    job = Job("https://youtu.be/dQw4w9WgXcQ", "tiny")
+    result = pipeline.run(job.url, "dQw4w9WgXcQ", job)
+
+    assert result["source"] == "whisper"
+    assert result["text"] == words(30)
+    assert job.segments == result["segments"]
+    # 作業ディレクトリは片付けられている
+    assert os.listdir(tmp_path / "work") == []
+
+
+def test_non_youtube_url_skips_captions(tmp_path):
+    def fail(video_id, languages):
+        raise AssertionError("captions should not be fetched")
+
+    audio_path = tmp_path / "speech.wav"
+    write_wav(audio_path, make_speech(3))
+    pipeline = make_pipeline(tmp_path, fail, str(audio_path))
+    job = Job("https://example.com/video.mp4", "tiny")
+    assert pipeline.run(job.url, None, job)["source"] == "whisper"
+
+
+def test_no_source_raises(tmp_path):
+    pipeline = TranscriptPipeline([CaptionSource(["en"], fetch=no_captions)])
+    with pytest.raises(NoTranscript):
+        pipeline.run("https://youtu.be/dQw4w9WgXcQ", "dQw4w9WgXcQ", Job("x"))
+
+
+def test_caption_fetch_errors_fall_back(monkeypatch):
+    class BrokenApi:
+        def list(self, video_id):
+            raise ConnectionError("network is down")
+
+    monkeypatch.setattr(sources, "YouTubeTranscriptApi", BrokenApi)
+    assert fetch_youtube_captions("dQw4w9WgXcQ", ["en"]) == (None, None)
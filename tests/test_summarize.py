@@ -0,0 +1,81 @@
+import pytest
+
+from cache import TranscriptCache
+from summarize import COMBINE_PROMPT, MAP_PROMPT, REDUCE_PROMPT, StubBackend, Summarizer, count_tokens
+
+MAP_HEAD = MAP_PROMPT.split("\n\n")[0]
+COMBINE_HEAD = COMBINE_PROMPT.split("\n\n")[0]
+REDUCE_HEAD = REDUCE_PROMPT.split("{length}")[0]
+
+
+class CountingBackend(StubBackend):
+    def __init__(self, max_tokens):
+        super().__init__(max_tokens)
+        self.prompts = []
+
+    def complete(self, prompt):
+        self.prompts.append(prompt)
+        return super().complete(prompt)
+
+    def count(self, head):
+        return sum(1 for p in self.prompts if p.startswith(head))
+
+
+def transcript(n_segments):
+    segments = [{"start": i, "end": i + 1, "text": "segment %d has five words" % i} for i in range(n_segments)]
+    return {"text": " ".join(s["text"] for s in segments), "segments": segments}
+
+
+@pytest.fixture
+def backend():
+    return CountingBackend(max_tokens=8)
+
+
+@pytest.fixture
+def summarizer(backend, tmp_path):
+    return Summarizer(backend, cache=TranscriptCache(str(tmp_path), max_bytes=10 ** 7), max_chunk_tokens=20)
+
+
+def test_chunks_stay_within_token_budget(summarizer, backend):
+    result = summarizer.summarize(transcript(40))
+    map_texts = [p.split("\n\n", 1)[1] for p in backend.prompts if p.startswith(MAP_HEAD)]
+    assert result["chunks"] == len(map_texts) == 10
+    assert all(count_tokens(text) <= 20 for text in map_texts)
+
+
+def test_partial_summaries_are_combined_in_rounds(backend):
+    Summarizer(backend, max_chunk_tokens=20).summarize(transcript(40))
+    # 10個の部分要約(80トークン) → 5 → 3 → 2 の3段でまとめる
+    assert backend.count(COMBINE_HEAD) == 5 + 3 + 2
+    assert backend.count(REDUCE_HEAD) == 1
+    reduce_prompt = [p for p in backend.prompts if p.startswith(REDUCE_HEAD)][0]
+    assert count_tokens(reduce_prompt.split("\n\n", 1)[1]) <= 20
+
+
+def test_changing_length_or_style_reuses_map_results(summarizer, backend):
+    first = summarizer.summarize(transcript(40), "short", "paragraph")
+    calls = len(backend.prompts)
+    second = summarizer.summarize(transcript(40), "long", "bullets")
+    new_prompts = backend.prompts[calls:]
+
+    assert [p for p in new_prompts if not p.startswith(REDUCE_HEAD)] == []
+    assert len(new_prompts) == 1
+    assert second["chunks"] == first["chunks"]
+
+    # 同じ設定ならLLMを一度も呼ばない
+    summarizer.summarize(transcript(40), "long", "bullets")
+    assert len(backend.prompts) == calls + 1
+
+
+def test_empty_transcript_skips_backend(summarizer, backend):
+    assert summarizer.summarize({"text": "", "segments": []}) == {
+        "summary": "", "chunks": 0, "length": "medium", "style": "paragraph",
+    }
+    assert summarizer.summarize({"text": "  ", "segments": [{"start": 0, "end": 1, "text": " "}]})["summary"] == ""
+    assert backend.prompts == []
+
+
+@pytest.mark.parametrize("options", [{"length": "huge"}, {"style": "poem"}, {"length": ["short"]}, {"style": {}}])
+def test_unknown_options_are_rejected(summarizer, options):
+    with pytest.raises(ValueError):
+        summarizer.summarize(transcript(1), **options)